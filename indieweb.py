@@ -9,26 +9,48 @@ events that IndieWeb sites require.
 """
 
 import os, sys
+import re
+import ast
 import json
+import time
+import hmac
+import random
+import cProfile
 import uuid
 import urllib
+import gzip
+import hashlib
 import logging
 import datetime
+import mimetypes
 
-from urlparse import urlparse, ParseResult
+from StringIO import StringIO
+from contextlib import contextmanager
+
+from urlparse import urlparse, urljoin, parse_qsl, ParseResult
+from xml.sax.saxutils import escape, quoteattr
 
 import redis
 import requests
 import ronkyuu
-import ninka
 
+from bs4 import BeautifulSoup
 from bearlib.config import Config
 from mf2py.parser import Parser
-from flask import Flask, request, redirect, render_template, session, flash
+from flask import Flask, request, redirect, render_template, session, flash, make_response, send_from_directory, g, has_request_context
+from flask.helpers import safe_join
+from werkzeug.http import is_resource_modified
+from jinja2 import Markup
 from flask.ext.wtf import Form
 from wtforms import TextField, HiddenField, BooleanField
 from wtforms.validators import Required
 
+try:
+    import brotli
+    _brotli = True
+except ImportError:
+    _brotli = False
+
 
 class LoginForm(Form):
     me           = TextField('me', validators = [ Required() ])
@@ -43,6 +65,22 @@ class TokenForm(Form):
     client_id    = TextField('client_id', validators = [])
     state        = TextField('state', validators = [])
 
+class OutboundError(Exception):
+    """An outbound request failed or was not attempted
+    """
+
+class BudgetExhausted(OutboundError):
+    """The deadline for the current request has passed
+    """
+
+class CircuitOpen(OutboundError):
+    """The circuit breaker for the remote host is open
+    """
+
+class InvalidURL(ValueError):
+    """The URL can not be requested, retrying will not help
+    """
+
 
 # check for uwsgi, use PWD if present or getcwd() if not
 _uwsgi = __name__.startswith('uwsgi')
@@ -53,12 +91,24 @@ else:
     _ourPath    = os.getcwd()
     _configFile = os.path.join(_ourPath, 'indieweb.cfg')
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)
 app.config['SECRET_KEY'] = 'foo'  # replaced downstream
 cfg = None
 db  = None
 templateData = {}
 entries      = []
+entryIndex   = {}
+urlAliases   = {}
+queryCache   = {}
+staticPath   = os.path.join(app.root_path, 'static')
+assetPath    = os.path.join(staticPath, 'build')
+assetFiles   = {}
+feedFormats  = ('html', 'atom', 'json')
+feedItems    = dict([(fmt, []) for fmt in feedFormats])
+feedCurrent  = {}
+feedArchives = dict([(fmt, {}) for fmt in feedFormats])
+breakers     = {}
+metrics      = {}
 
 def baseDomain(domain, includeScheme=True):
     """Return only the network location portion of the given domain
@@ -74,17 +124,45 @@ def baseDomain(domain, includeScheme=True):
         result += url.netloc
     return result
 
+def hashKey(prefix, *parts):
+    """Return a short fixed length key for the given parts
+
+    Auth data is stored using these keys (all with a TTL):
+      l:<hash of me>                  login hash    auth_timeout, then session_timeout
+      s:<token uuid bytes>            login key     session_timeout
+      a:<hash of me, client, scope>   token bytes   token_timeout
+      t:<token uuid bytes>            token hash    token_timeout
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+        digest.update('%s\0' % part)
+    return '%s%s' % (prefix, digest.digest()[:12])
+
+def tokenKey(prefix, token):
+    """Return the key for the given token string, None if it is not a valid token
+    """
+    try:
+        return '%s%s' % (prefix, uuid.UUID(token).bytes)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def loginKey(me):
+    return hashKey('l:', me)
+
 def clearAuth():
     """Clear both the Session cookie and any stored token data
     """
     if 'indieauth_token' in session:
         indieauth_token = session['indieauth_token']
         if db is not None:
-            key = db.get('token-%s' % indieauth_token)
+            key = tokenKey('s:', indieauth_token)
             if key:
-                data = db.hgetall(key)
+                login = db.get(key)
+                if login:
+                    db.delete(login)
                 db.delete(key)
-                db.delete('token-%s' % indieauth_token)
     session.pop('indieauth_token', None)
     session.pop('indieauth_scope', None)
     session.pop('indieauth_id', None)
@@ -99,10 +177,10 @@ def checkAuth():
         indieauth_token = session['indieauth_token']
         app.logger.info('session cookie found')
         if db is not None:
-            key = db.get('token-%s' % indieauth_token)
+            key = tokenKey('s:', indieauth_token)
             if key:
-                data = db.hgetall(key)
-                if data and data['token'] == indieauth_token:
+                login = db.get(key)
+                if login and db.hget(login, 't') == key[2:]:
                     authed = True
     return authed, indieauth_id
 
@@ -112,12 +190,13 @@ def checkAccessToken(access_token):
     client_id  = None
     me         = None
     scope      = None
-    key        = db.get('token-%s' % access_token)
-    if key:
-        data      = key.split('-')
-        me        = data[1]
-        client_id = data[2]
-        scope     = data[3]
+    key        = tokenKey('t:', access_token)
+    if key and db is not None:
+        data = db.hgetall(key)
+        if data:
+            me        = data['m']
+            client_id = data['c']
+            scope     = data.get('s')
 
     return me, client_id, scope
 
@@ -138,74 +217,88 @@ def handleLogin():
     if form.validate_on_submit():
         app.logger.info('me [%s]' % form.me.data)
 
-        me            = baseDomain(form.me.data)
-        authEndpoints = ninka.indieauth.discoverAuthEndpoints(me)
-
-        if 'authorization_endpoint' in authEndpoints:
-            authURL = None
-            for url in authEndpoints['authorization_endpoint']:
-                authURL = url
-                break
-
-            if authURL is not None:
-                url = ParseResult(authURL.scheme, 
-                                  authURL.netloc,
-                                  authURL.path,
-                                  authURL.params,
-                                  urllib.urlencode({ 'me':            me,
-                                                     'redirect_uri':  form.redirect_uri.data,
-                                                     'client_id':     form.client_id.data,
-                                                     'scope':         'post',
-                                                     'response_type': 'id'
-                                                   }),
-                                  authURL.fragment).geturl()
-                if db is not None:
-                    key = 'login-%s' % me
-                    data = db.hgetall(key)
-                    if data: # clear any existing auth data
-                        db.delete('token-%s' % data['token'])
-                        db.hdel(key, 'token')
-                    db.hset(key, 'from_uri',     form.from_uri.data)
-                    db.hset(key, 'redirect_uri', form.redirect_uri.data)
-                    db.hset(key, 'client_id',    form.client_id.data)
-                    db.hset(key, 'scope',        'post')
-                    db.expire(key, cfg['auth_timeout']) # expire in N minutes unless successful
-                return redirect(url)
+        me = baseDomain(form.me.data)
+        try:
+            r = fetchURL(me)
+        except InvalidURL as e:
+            app.logger.info('auth endpoint discovery failed: %s' % e)
+            return 'invalid domain %s' % me, 400
+        except OutboundError as e:
+            app.logger.info('auth endpoint discovery failed: %s' % e)
+            return 'unable to reach %s' % me, 503
+
+        authURL = None
+        if r.status_code == requests.codes.ok:
+            authURL = findLinkRel(r, ('authorization_endpoint',))
+
+        if authURL is not None:
+            authURL = urlparse(authURL)
+            url = ParseResult(authURL.scheme, 
+                              authURL.netloc,
+                              authURL.path,
+                              authURL.params,
+                              urllib.urlencode({ 'me':            me,
+                                                 'redirect_uri':  form.redirect_uri.data,
+                                                 'client_id':     form.client_id.data,
+                                                 'scope':         'post',
+                                                 'response_type': 'id'
+                                               }),
+                              authURL.fragment).geturl()
+            if db is not None:
+                key   = loginKey(me)
+                token = db.hget(key, 't')
+                if token: # clear any existing auth data
+                    db.delete('s:%s' % token)
+                    db.hdel(key, 't')
+                db.hmset(key, { 'f': form.from_uri.data or '',
+                                'r': form.redirect_uri.data,
+                                'c': form.client_id.data,
+                                's': 'post',
+                              })
+                db.expire(key, cfg['auth_timeout']) # expire in N minutes unless successful
+            return redirect(url)
         else:
             return 'insert fancy no auth endpoint found error message here', 403
 
     templateData['title'] = 'Sign In'
     templateData['form']  = form
-    return render_template('login.jinja', **templateData)
+    return renderTemplate('login.jinja', **templateData)
 
 @app.route('/success', methods=['GET',])
 def handleLoginSuccess():
     app.logger.info('handleLoginSuccess [%s]' % request.method)
-    me   = request.args.get('me')
-    code = request.args.get('code')
+    me       = request.args.get('me')
+    code     = request.args.get('code')
+    scope    = None
+    from_uri = None
     app.logger.info('me [%s] code [%s]' % (me, code))
 
     if db is not None:
         app.logger.info('getting data to validate auth code')
-        key  = 'login-%s' % me
+        key  = loginKey(me)
         data = db.hgetall(key)
         if data:
-            r = ninka.indieauth.validateAuthCode(code=code, 
-                                                 client_id=me,
-                                                 redirect_uri=data['redirect_uri'])
+            try:
+                r = validateAuthCode(code=code, 
+                                     client_id=me,
+                                     redirect_uri=data['r'])
+            except InvalidURL as e:
+                app.logger.info('login code not validated: %s' % e)
+                return 'authentication failed', 403
+            except OutboundError as e:
+                app.logger.info('login code not validated: %s' % e)
+                return ('Unable to validate login, try again later', 503, {'Retry-After': str(cfg.breaker_cooldown)})
             if r['status'] == requests.codes.ok:
                 app.logger.info('login code verified')
                 scope    = r['response']['scope']
-                from_uri = data['from_uri']
-                token    = str(uuid.uuid4())
+                from_uri = data['f']
+                token    = uuid.uuid4()
 
-                db.hset(key, 'code',  code)
-                db.hset(key, 'token', token)
-                db.expire(key, cfg['auth_timeout'])
-                db.set('token-%s' % token, key)
-                db.expire('token-%s' % code, cfg['auth_timeout'])
+                db.hset(key, 't', token.bytes)
+                db.expire(key, cfg.session_timeout)
+                db.set('s:%s' % token.bytes, key, ex=cfg.session_timeout)
 
-                session['indieauth_token'] = token
+                session['indieauth_token'] = str(token)
                 session['indieauth_scope'] = scope
                 session['indieauth_id']    = me
             else:
@@ -227,13 +320,11 @@ def handleAuth():
     app.logger.info('handleAuth [%s]' % request.method)
     result = False
     if db is not None:
-        token = request.args.get('token')
-        if token is not None:
-            me = db.get('token-%s' % token)
-            if me:
-                data = db.hgetall(me)
-                if data and data['token'] == token:
-                    result = True
+        key = tokenKey('s:', request.args.get('token'))
+        if key is not None:
+            login = db.get(key)
+            if login and db.hget(login, 't') == key[2:]:
+                result = True
     if result:
         return 'valid', 200
     else:
@@ -243,6 +334,126 @@ def handleAuth():
         return 'invalid', 403
 
 
+def normalizeHost(netloc):
+    host = netloc.lower()
+    for port in (':80', ':443'):
+        if host.endswith(port):
+            host = host[:-len(port)]
+    return host
+
+def buildURLAliases(config):
+    """Map every host name our entries can be reached at to the host of baseurl
+    """
+    canonical = normalizeHost(urlparse(config.baseurl).netloc)
+    urlAliases.clear()
+    for alias in [ config.our_domain ] + list(config.domain_aliases):
+        if alias:
+            alias = normalizeHost(alias)
+            urlAliases[alias]            = canonical
+            urlAliases['www.%s' % alias] = canonical
+    urlAliases['www.%s' % canonical] = canonical
+
+def normalizeURL(url):
+    """Return the host and path of the given URL in a form that compares equal
+    regardless of scheme, host case, default ports, trailing slashes and host aliases
+    """
+    if '//' not in url:
+        url = 'http://%s' % url
+    parts = urlparse(url.strip())
+    host  = normalizeHost(parts.netloc)
+    host  = urlAliases.get(host, host)
+    return '%s%s' % (host, parts.path.rstrip('/'))
+
+def entryURL(entry):
+    """Return the published URL for the given entry
+    """
+    return '%s/%s' % (cfg.baseurl, entry['slug'])
+
+def entryProperties(entry):
+    """Return the Micropub (mf2 json) representation of the given entry
+    """
+    return { 'type':       [ 'h-entry' ],
+             'properties': { 'name':      [ entry['title'] ],
+                             'content':   [ entry['text'] ],
+                             'published': [ entry['date'].strftime('%Y-%m-%dT%H:%M:%SZ') ],
+                             'url':       [ entryURL(entry) ],
+                           }
+           }
+
+def cachedResponse(data):
+    """Serialize the given data once and return it with the ETag used
+    for conditional requests against it
+    """
+    body = json.dumps(data, sort_keys=True)
+    return { 'data': data,
+             'body': body,
+             'etag': hashlib.sha1(body).hexdigest(),
+           }
+
+def buildMicropubQueries(config):
+    """Precompute the Micropub q=config and q=syndicate-to responses.
+
+    Only needs to be called again when the config changes.
+    """
+    syndicateTo = []
+    for target in config.syndicate_to:
+        syndicateTo.append({ 'uid': target['uid'], 'name': target.get('name', target['uid']) })
+
+    queryCache['syndicate-to'] = cachedResponse({ 'syndicate-to': syndicateTo })
+    queryCache['config']       = cachedResponse({ 'syndicate-to': syndicateTo })
+
+def addEntry(entry):
+    """Add the entry to the list of published entries and update
+    any data precomputed from them
+    """
+    url = entryURL(entry)
+    entries.append(entry)
+    cached          = cachedResponse(entryProperties(entry))
+    cached['entry'] = entry
+    entryIndex[normalizeURL(url)] = cached
+    addFeedEntry(entry)
+
+def removeEntry(entry):
+    """Remove the entry from the list of published entries and update
+    any data precomputed from them
+    """
+    url = entryURL(entry)
+    entries.remove(entry)
+    entryIndex.pop(normalizeURL(url), None)
+    buildFeeds()
+
+def jsonResponse(cached):
+    """Return a conditional (ETag based) JSON response for the given precomputed item
+    """
+    response = make_response(cached['body'])
+    response.mimetype = 'application/json'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(cached['etag'])
+    return response.make_conditional(request)
+
+def processMicropubQuery(query):
+    """Handle a Micropub GET query using only precomputed data
+    """
+    if query in ('config', 'syndicate-to'):
+        return jsonResponse(queryCache[query])
+    elif query == 'source':
+        url = request.args.get('url')
+        if url is None:
+            return ('Micropub source query requires a url parameter', 400, {})
+        cached = entryIndex.get(normalizeURL(url))
+        if cached is None:
+            return ('Micropub source not found for %s' % url, 404, {})
+        properties = request.args.getlist('properties[]') or request.args.getlist('properties')
+        if properties:
+            data = { 'properties': {} }
+            for key in properties:
+                if key in cached['data']['properties']:
+                    data['properties'][key] = cached['data']['properties'][key]
+            return jsonResponse(cachedResponse(data))
+        return jsonResponse(cached)
+    else:
+        return ('Unknown Micropub query %s' % query, 400, {})
+
 def handleMicropubEntry(data):
     # do something with the parameters sent by the micropub client
     # and return the new location and a 2## code
@@ -294,8 +505,20 @@ def handleMicroPub():
                 else:
                     return 'unauthorized', 401
         elif request.method == 'GET':
-            # add support for /micropub?q=syndicate-to
-            return 'not implemented', 501
+            query = request.args.get('q')
+            if query is None:
+                return ('Micropub query requires a q parameter', 400, {})
+            return processMicropubQuery(query)
+
+def storeAccessToken(r, key, token, me, client_id, scope, ttl):
+    """Store the access token (uuid bytes) for the app key with the given ttl
+    """
+    pipe = r.pipeline()
+    pipe.set(key, token, ex=ttl)
+    pipe.hmset('t:%s' % token, { 'm': me, 'c': client_id, 's': scope })
+    pipe.expire('t:%s' % token, ttl)
+    with phase('redis'):
+        pipe.execute()
 
 @app.route('/token', methods=['POST', 'GET'])
 def handleToken():
@@ -324,35 +547,392 @@ def handleToken():
         client_id    = request.form.get('client_id')
         state        = request.form.get('state')
 
-        r = ninka.indieauth.validateAuthCode(code=code, 
-                                             client_id=me,
-                                             state=state,
-                                             redirect_uri=redirect_uri)
+        try:
+            r = validateAuthCode(code=code, 
+                                 client_id=me,
+                                 state=state,
+                                 redirect_uri=redirect_uri)
+        except InvalidURL as e:
+            app.logger.info('token request auth code not validated: %s' % e)
+            return ('Invalid auth code', 400, {})
+        except OutboundError as e:
+            app.logger.info('token request auth code not validated: %s' % e)
+            return ('Unable to validate auth code, try again later', 503, {'Retry-After': str(cfg.breaker_cooldown)})
         if r['status'] == requests.codes.ok:
             app.logger.info('token request auth code verified')
             scope = r['response']['scope']
-            key   = 'app-%s-%s-%s' % (me, client_id, scope)
+            key   = hashKey('a:', me, client_id, scope)
             token = db.get(key)
             if token is None:
-                token     = str(uuid.uuid4())
-                token_key = 'token-%s' % token
-                db.set(key, token)
-                db.set(token_key, key)
+                token = uuid.uuid4().bytes
+                storeAccessToken(db, key, token, me, client_id, scope, cfg.token_timeout)
+            else:
+                db.expire(key, cfg.token_timeout)
+                db.expire('t:%s' % token, cfg.token_timeout)
+            token = str(uuid.UUID(bytes=token))
 
-            app.logger.info('[%s] [%s]' % (key, token))
+            app.logger.info('[%s] [%s]' % (me, token))
 
             params = { 'me': me,
                        'scope': scope,
                        'access_token': token
                      }
             return (urllib.urlencode(params), 200, {'Content-Type': 'application/x-www-form-urlencoded'})
+        else:
+            return ('Invalid auth code', 400, {})
+
+def incrMetric(name, amount=1):
+    """Increment the named counter, shared across workers when Redis is available
+    """
+    if db is not None:
+        db.hincrby('metrics', name, amount)
+    else:
+        metrics[name] = metrics.get(name, 0) + amount
+
+@app.before_request
+def startDeadline():
+    g.deadline = time.time() + cfg.request_budget
+
+def remainingBudget():
+    """Return the seconds left before the current request's deadline
+    """
+    deadline  = getattr(g, 'deadline', None)
+    if deadline is None:
+        return cfg.request_budget
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        incrMetric('budget_exhausted')
+        raise BudgetExhausted('request deadline exceeded')
+    return remaining
+
+def callTimeout():
+    """Return the timeout for an outbound call: outbound_timeout, or less if the
+    request's deadline is closer, and whether the deadline shortened it
+    """
+    remaining = remainingBudget()
+    return min(cfg.outbound_timeout, remaining), remaining < cfg.outbound_timeout
+
+def callRemaining(deadline):
+    """Return the seconds left of an outbound call's timeout
+    """
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise requests.exceptions.ReadTimeout('timeout exceeded')
+    return remaining
+
+def breakerState(host):
+    if db is not None:
+        return db.hgetall('breaker-%s' % host)
+    else:
+        return breakers.get(host, {})
+
+def breakerAllow(host, state):
+    """Determine if a request to host is allowed.
+
+    An open breaker rejects every request until breaker_cooldown seconds
+    have passed, after that a single probe request per cooldown period
+    is allowed through (half-open) to test if the host has recovered.
+    """
+    if 'opened' not in state:
+        return True
+    now = time.time()
+    if now - float(state['opened']) < cfg.breaker_cooldown:
+        return False
+    if db is not None:
+        return db.set('breaker-probe-%s' % host, now, nx=True, ex=cfg.breaker_cooldown)
+    else:
+        if now - state.get('probe', 0) < cfg.breaker_cooldown:
+            return False
+        state['probe'] = now
+        return True
+
+def breakerSuccess(host, state):
+    if state:
+        if db is not None:
+            db.delete('breaker-%s' % host, 'breaker-probe-%s' % host)
+        else:
+            breakers.pop(host, None)
+
+def breakerFailure(host, state):
+    """Record a failed request to host, opening the breaker after breaker_threshold
+    failures or if the failure was a half-open probe
+    """
+    key = 'breaker-%s' % host
+    if db is not None:
+        failures = db.hincrby(key, 'failures', 1)
+        db.expire(key, cfg.breaker_cooldown * 10)
+    else:
+        state    = breakers.setdefault(host, state)
+        failures = state['failures'] = int(state.get('failures', 0)) + 1
+    if failures >= cfg.breaker_threshold or 'opened' in state:
+        app.logger.info('circuit breaker opened for %s' % host)
+        incrMetric('breaker_trips')
+        if db is not None:
+            db.hset(key, 'opened', time.time())
+        else:
+            state['opened'] = time.time()
+            state.pop('probe', None)
+
+# only these count against the circuit breaker of a host
+networkErrors = (requests.exceptions.ConnectionError,
+                 requests.exceptions.Timeout,
+                 requests.exceptions.ChunkedEncodingError)
+
+def readContent(r, deadline):
+    """Read the streamed body of the response, checking the call's
+    deadline after each chunk
+    """
+    chunks = []
+    try:
+        for chunk in r.iter_content(8192):
+            chunks.append(chunk)
+            callRemaining(deadline)
+    except:
+        r.close()
+        raise
+    r._content          = ''.join(chunks)
+    r._content_consumed = True
+
+def outboundRequest(method, url, verify=True, data=None):
+    """Make the request within the current request's deadline and the
+    circuit breaker of the url's host.
+
+    The timeout requests applies is per connect and per socket read, so
+    redirects (at most max_redirects) are followed here and the body is
+    streamed with the deadline checked between chunks.
+
+    A timeout only counts against the host when it was given the full
+    outbound_timeout. If earlier calls used up the request's budget and
+    the timeout was cut short, BudgetExhausted is raised instead.
+    """
+    parts = urlparse(url)
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        raise InvalidURL('unable to request %s' % url)
+    host  = parts.netloc.lower()
+    state = breakerState(host)
+    if not breakerAllow(host, state):
+        incrMetric('breaker_rejected')
+        raise CircuitOpen('circuit breaker open for %s' % host)
+    timeout, limited = callTimeout()
+    deadline         = time.time() + timeout
+    try:
+        with phase('outbound'):
+            for redirect in range(cfg.max_redirects + 1):
+                r = getattr(requests, method)(url, verify=verify, data=data, timeout=callRemaining(deadline),
+                                              stream=True, allow_redirects=False)
+                if not r.is_redirect:
+                    break
+                r.close()
+                url = urljoin(r.url, r.headers['location'])
+                if urlparse(url).scheme not in ('http', 'https'):
+                    raise InvalidURL('redirected to %s' % url)
+                if r.status_code in (301, 302, 303):
+                    method = 'get'
+                    data   = None
+            else:
+                raise InvalidURL('more than %d redirects for %s' % (cfg.max_redirects, url))
+            readContent(r, deadline)
+    except networkErrors as e:
+        if limited and isinstance(e, requests.exceptions.Timeout):
+            incrMetric('budget_exhausted')
+            raise BudgetExhausted('request deadline exceeded calling %s' % url)
+        incrMetric('outbound_failures')
+        breakerFailure(host, state)
+        raise OutboundError('request to %s failed: %s' % (url, e))
+    except requests.exceptions.RequestException as e:
+        raise InvalidURL('unable to request %s: %s' % (url, e))
+    if r.status_code >= 500:
+        incrMetric('outbound_failures')
+        breakerFailure(host, state)
+    else:
+        breakerSuccess(host, state)
+    return r
+
+def fetchURL(url, verify=True):
+    return outboundRequest('get', url, verify=verify)
+
+def validateAuthCode(code, redirect_uri, client_id, state=None):
+    """Call the authorization endpoint of client_id to validate the auth code.
+
+    Does what ninka.indieauth.validateAuthCode() does, but both the endpoint
+    discovery and the validation request go through outboundRequest()
+    """
+    payload = { 'code':         code,
+                'redirect_uri': redirect_uri,
+                'client_id':    client_id,
+              }
+    if state is not None:
+        payload['state'] = state
+
+    validationEndpoint = 'https://indieauth.com/auth'
+    r = fetchURL(client_id)
+    if r.status_code == requests.codes.ok:
+        authURL = findLinkRel(r, ('authorization_endpoint',))
+        if authURL is not None:
+            validationEndpoint = urlparse(authURL)._replace(query='', fragment='').geturl()
+
+    r = outboundRequest('post', validationEndpoint, data=payload)
+    result = { 'status':  r.status_code,
+               'headers': r.headers,
+             }
+    if r.status_code == requests.codes.ok:
+        result['response'] = dict(parse_qsl(responseContent(r)))
+    return result
+
+def responseContent(r):
+    """Return the decoded text if a charset was given, otherwise the raw content
+    """
+    if 'charset' in r.headers.get('content-type', ''):
+        return r.text
+    else:
+        return r.content
+
+def findLinkRel(r, rels):
+    """Return the first URL found for any of the given rel values in
+    either the Link: header or the html of the response
+    """
+    for rel in rels:
+        if rel in r.links:
+            return urljoin(r.url, r.links[rel]['url'])
+    with phase('discovery'):
+        links = BeautifulSoup(responseContent(r), 'html.parser').find_all(('link', 'a'), rel=rels, href=True)
+    for link in links:
+        return urljoin(r.url, link['href'])
+    return None
+
+@app.route('/metrics', methods=['GET'])
+def handleMetrics():
+    if db is not None:
+        data = db.hgetall('metrics')
+    else:
+        data = metrics
+    body = ''
+    for name in sorted(data):
+        body += 'indieweb_%s %s\n' % (name, data[name])
+    return (body, 200, {'Content-Type': 'text/plain; version=0.0.4'})
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the with block to the named phase of the current request
+    """
+    started = time.time()
+    try:
+        yield
+    finally:
+        if has_request_context() and hasattr(g, 'phases'):
+            g.phases[name] = g.phases.get(name, 0) + (time.time() - started)
+
+def renderTemplate(template, **context):
+    with phase('template'):
+        return render_template(template, **context)
+
+def checkProfileSecret(value):
+    """Compare the value in constant time with profile_secret, if one is set
+    """
+    if not cfg.profile_secret or value is None:
+        return False
+    secret = cfg.profile_secret
+    if isinstance(secret, unicode):
+        secret = secret.encode('utf-8')
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return hmac.compare_digest(value, secret)
+
+@app.before_request
+def startProfile():
+    """Start timing the request and, if asked for with the profile_secret in the
+    X-Indieweb-Profile header or picked by profile_sample_rate, profiling it
+    """
+    g.started  = time.time()
+    g.phases   = {}
+    g.profiler = None
+    if checkProfileSecret(request.headers.get('X-Indieweb-Profile')) or \
+       (cfg.profile_sample_rate > 0 and random.random() < cfg.profile_sample_rate):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+def saveProfile(profiler, route):
+    """Write the profile stats for route to profile_path, keeping only the newest profile_keep
+    """
+    if not os.path.exists(cfg.profile_path):
+        os.makedirs(cfg.profile_path)
+    filename = '%s-%s.pstats' % (route, datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'))
+    profiler.dump_stats(os.path.join(cfg.profile_path, filename))
+
+    profiles = sorted([ name for name in os.listdir(cfg.profile_path) if name.startswith('%s-' % route) ])
+    for name in profiles[:-cfg.profile_keep]:
+        os.remove(os.path.join(cfg.profile_path, name))
+
+@app.teardown_request
+def finishProfile(exception=None):
+    """Store the profile of the request, if one was taken, and log the
+    per-phase breakdown of any request slower than slow_request_ms
+    """
+    if not hasattr(g, 'started'):
+        return
+    elapsed = time.time() - g.started
+    if request.url_rule is not None:
+        route = request.url_rule.endpoint
+    else:
+        route = 'unknown'
+
+    if g.profiler is not None:
+        g.profiler.disable()
+        saveProfile(g.profiler, route)
+
+    if elapsed * 1000 >= cfg.slow_request_ms:
+        phases = {}
+        for name in g.phases:
+            phases[name] = int(g.phases[name] * 1000)
+        phases['other'] = int((elapsed - sum(g.phases.values())) * 1000)
+        app.logger.warning('slow request %s %s [%s] %dms %s' % (request.method, request.path, route,
+                                                                  elapsed * 1000, json.dumps(phases, sort_keys=True)))
+
+def checkAdmin():
+    """Check if the request is from the site owner, either by Session cookie
+    or by an access token issued to our_domain
+    """
+    authed, me = checkAuth()
+    if authed:
+        return baseDomain(me, includeScheme=False) == cfg.our_domain
+
+    me           = None
+    access_token = request.headers.get('Authorization')
+    if access_token:
+        me, client_id, scope = checkAccessToken(access_token.replace('Bearer ', ''))
+    return me is not None and baseDomain(me, includeScheme=False) == cfg.our_domain
+
+@app.route('/admin/profiles', methods=['GET'])
+def handleProfiles():
+    app.logger.info('handleProfiles [%s]' % request.method)
+    if not checkAdmin():
+        return 'unauthorized', 401
+
+    profiles = []
+    if os.path.exists(cfg.profile_path):
+        for name in sorted(os.listdir(cfg.profile_path)):
+            if name.endswith('.pstats'):
+                profiles.append({ 'name':  name,
+                                  'route': name.rsplit('-', 1)[0],
+                                  'size':  os.path.getsize(os.path.join(cfg.profile_path, name)),
+                                  'url':   '/admin/profiles/%s' % name,
+                                })
+    return (json.dumps({ 'profiles': profiles }), 200, {'Content-Type': 'application/json'})
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def handleProfile(name):
+    app.logger.info('handleProfile [%s] %s' % (request.method, name))
+    if not checkAdmin():
+        return 'unauthorized', 401
+    return send_from_directory(cfg.profile_path, name, as_attachment=True, mimetype='application/octet-stream')
 
 def validURL(targetURL):
     """Validate the target URL exists.
 
-    In a real app you would need to do a database lookup or a HEAD request, here we just check the URL
+    Only the URLs of published entries, as found in entryIndex, are valid
+    so mentions of any other URL are rejected without a network request
     """
-    if '/article' in targetURL:
+    if targetURL and normalizeURL(targetURL) in entryIndex:
         result = 200
     else:
         result = 404
@@ -391,26 +971,31 @@ def processVouch(sourceURL, targetURL, vouchDomain):
         for domain in h.readlines():
             vouchDomains.append(domain.strip().lower())
 
+    result = False
     if vouchDomain.lower() in vouchDomains:
         result = True
     else:
-        wmStatus, wmUrl = ronkyuu.discoverEndpoint(vouchDomain, test_urls=False)
-        if wmUrl is not None and wmStatus == 200:
-            authEndpoints = ninka.indieauth.discoverAuthEndpoints(vouchDomain)
-
-            if 'authorization_endpoint' in authEndpoints:
-                authURL = None
-                for url in authEndpoints['authorization_endpoint']:
-                    authURL = url
-                    break
+        # both endpoints are discovered from a single fetch of the vouch domain
+        vouchURL = vouchDomain
+        if '://' not in vouchURL:
+            vouchURL = 'http://%s' % vouchURL
+        try:
+            r = fetchURL(vouchURL, verify=False)
+        except InvalidURL as e:
+            app.logger.info('vouch domain rejected: %s' % e)
+            return result
+        if r.status_code == requests.codes.ok:
+            wmUrl = findLinkRel(r, ('webmention', 'http://webmention.org/'))
+            if wmUrl is not None:
+                authURL = findLinkRel(r, ('authorization_endpoint',))
                 if authURL is not None:
                     result = True
                     with open(vouchFile, 'a+') as h:
                         h.write('\n%s' % vouchDomain)
+    return result
 
-def processWebmention(sourceURL, targetURL, vouchDomain=None):
+def processWebmention(sourceURL, targetURL, r, vouchDomain=None):
     result = False
-    r      = requests.get(sourceURL, verify=False)
     if r.status_code == requests.codes.ok:
         mentionData = { 'sourceURL':   sourceURL,
                         'targetURL':   targetURL,
@@ -419,10 +1004,7 @@ def processWebmention(sourceURL, targetURL, vouchDomain=None):
                         'received':    datetime.date.today().strftime('%d %b %Y %H:%M'),
                         'postDate':    datetime.date.today().strftime('%Y-%m-%dT%H:%M:%S')
                       }
-        if 'charset' in r.headers.get('content-type', ''):
-            mentionData['content'] = r.text
-        else:
-            mentionData['content'] = r.content
+        mentionData['content'] = responseContent(r)
 
         if vouchDomain is not None and cfg['require_vouch']:
             mentionData['vouched'] = processVouch(sourceURL, targetURL, vouchDomain)
@@ -432,7 +1014,8 @@ def processWebmention(sourceURL, targetURL, vouchDomain=None):
             result = not cfg['require_vouch']
             app.logger.info('no vouch domain, result %s' % result)
 
-        mf2Data = Parser(doc=mentionData['content']).to_dict()
+        with phase('mf2'):
+            mf2Data = Parser(doc=mentionData['content']).to_dict()
         hcard   = extractHCard(mf2Data)
 
         mentionData['hcardName'] = hcard['name']
@@ -448,17 +1031,31 @@ def mention(sourceURL, targetURL, vouchDomain=None):
 
     To verify that the sourceURL has indeed referenced our targetURL
     we run findMentions() at it and scan the resulting href list.
+
+    The sourceURL is only fetched once, the same response is used to
+    find the mentions and to process the webmention.
     """
     app.logger.info('discovering Webmention endpoint for %s' % sourceURL)
 
-    mentions = ronkyuu.findMentions(sourceURL)
-    result   = False
+    r      = fetchURL(sourceURL)
+    result = False
+    if r.status_code != requests.codes.ok:
+        app.logger.info('mention() source returned %s' % r.status_code)
+        return result
+
+    content = responseContent(r)
+    if not content:
+        return result
+
+    with phase('discovery'):
+        mentions = ronkyuu.findMentions(sourceURL, content=content)
     app.logger.info('mentions %s' % mentions)
+    target   = normalizeURL(targetURL)
     for href in mentions['refs']:
-        if href != sourceURL and href == targetURL:
+        if href != sourceURL and normalizeURL(href) == target:
             app.logger.info('post at %s was referenced by %s' % (targetURL, sourceURL))
 
-            result = processWebmention(sourceURL, targetURL, vouchDomain)
+            result = processWebmention(sourceURL, targetURL, r, vouchDomain)
     app.logger.info('mention() returning %s' % result)
     return result
 
@@ -477,7 +1074,15 @@ def handleWebmention():
         app.logger.info('valid? %s' % valid)
 
         if valid == requests.codes.ok:
-            if mention(source, target, vouch):
+            try:
+                result = mention(source, target, vouch)
+            except InvalidURL as e:
+                app.logger.info('webmention not verified: %s' % e)
+                return 'Webmention source is invalid', 400
+            except OutboundError as e:
+                app.logger.info('webmention not verified: %s' % e)
+                return ('Unable to verify webmention, try again later', 503, {'Retry-After': str(cfg.breaker_cooldown)})
+            if result:
                 return redirect(target)
             else:
                 if vouch is None and cfg['require_vouch']:
@@ -487,19 +1092,383 @@ def handleWebmention():
         else:
             return 'invalid post', 404
 
+def gzipData(data, level=6):
+    """Return the given data gzip compressed
+    """
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level, mtime=0) as h:
+        h.write(data)
+    return buf.getvalue()
+
+def buildAssets(sourcePath, buildPath):
+    """Copy each static asset into buildPath with a content hash in its filename
+    along with gzip and (if available) brotli precompressed copies of it.
+
+    A manifest mapping the original asset names to the fingerprinted names
+    is written to buildPath/assets.json. Files from earlier builds that are
+    not in the new manifest are removed.
+    """
+    manifest = {}
+    if not os.path.exists(buildPath):
+        os.makedirs(buildPath)
+    for root, dirs, files in os.walk(sourcePath):
+        if os.path.abspath(root).startswith(os.path.abspath(buildPath)):
+            continue
+        for filename in files:
+            with open(os.path.join(root, filename), 'rb') as h:
+                data = h.read()
+            name        = os.path.relpath(os.path.join(root, filename), sourcePath)
+            base, ext   = os.path.splitext(name)
+            assetName   = '%s.%s%s' % (base, hashlib.sha1(data).hexdigest()[:12], ext)
+            assetTarget = os.path.join(buildPath, assetName)
+            if not os.path.exists(os.path.dirname(assetTarget)):
+                os.makedirs(os.path.dirname(assetTarget))
+            with open(assetTarget, 'wb') as h:
+                h.write(data)
+            with open('%s.gz' % assetTarget, 'wb') as h:
+                h.write(gzipData(data, level=9))
+            if _brotli:
+                with open('%s.br' % assetTarget, 'wb') as h:
+                    h.write(brotli.compress(data))
+            manifest[name] = assetName
+    with open(os.path.join(buildPath, 'assets.json'), 'w') as h:
+        json.dump(manifest, h, indent=2, sort_keys=True)
+
+    keep = set(['assets.json'])
+    for assetName in manifest.values():
+        keep.update((assetName, '%s.gz' % assetName, '%s.br' % assetName))
+    for root, dirs, files in os.walk(buildPath, topdown=False):
+        for filename in files:
+            target = os.path.join(root, filename)
+            if os.path.relpath(target, buildPath) not in keep:
+                os.remove(target)
+        if root != buildPath and not os.listdir(root):
+            os.rmdir(root)
+    return manifest
+
+def loadAssets(buildPath):
+    """Load the manifest written by buildAssets(), if present
+    """
+    assetFiles.clear()
+    manifestFile = os.path.join(buildPath, 'assets.json')
+    if os.path.exists(manifestFile):
+        with open(manifestFile, 'r') as h:
+            assetFiles.update(json.load(h))
+
+def assetURL(name):
+    """Return the URL for the given static asset, preferring the fingerprinted copy
+    """
+    if name in assetFiles:
+        return '/static/build/%s' % assetFiles[name]
+    else:
+        return '/static/%s' % name
+
+@app.context_processor
+def assetContext():
+    return { 'assetURL': assetURL }
+
+def acceptedEncoding():
+    """Return the best compression the client accepts that we can produce
+    """
+    if _brotli and request.accept_encodings.quality('br') > 0:
+        return 'br'
+    elif request.accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+@app.route('/static/<path:filename>', methods=['GET'])
+def handleStatic(filename):
+    mimetype, fileEncoding = mimetypes.guess_type(filename)
+    if fileEncoding is not None:
+        # precompressed copies are only sent in place of the asset they belong to
+        return 'not found', 404
+    mimetype = mimetype or 'application/octet-stream'
+    encoding = acceptedEncoding()
+    sendName = filename
+    if encoding is not None:
+        compressedName = '%s.%s' % (filename, 'br' if encoding == 'br' else 'gz')
+        if os.path.isfile(safe_join(staticPath, compressedName)):
+            sendName = compressedName
+        else:
+            encoding = None
+
+    # only the fingerprinted copies never change, not the manifest
+    if filename.startswith('build/') and filename[len('build/'):] in assetFiles.values():
+        cacheTimeout = 31536000
+    else:
+        cacheTimeout = None
+
+    response = send_from_directory(staticPath, sendName, mimetype=mimetype, cache_timeout=cacheTimeout, conditional=True)
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if cacheTimeout is not None:
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % cacheTimeout
+    return response
+
+@app.after_request
+def compressResponse(response):
+    """Compress dynamic html responses larger than compress_min_size
+
+    The compressed body gets its own ETag (the original one with the encoding
+    appended) and the conditional request is checked again against it
+    """
+    if response.status_code != 200 or response.direct_passthrough or \
+       response.mimetype != 'text/html' or 'Content-Encoding' in response.headers:
+        return response
+
+    data = response.get_data()
+    if len(data) < cfg.compress_min_size:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = acceptedEncoding()
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=5))
+    elif encoding == 'gzip':
+        response.set_data(gzipData(data))
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None:
+            response.set_etag('%s-%s' % (etag, encoding), weak)
+            response.make_conditional(request)
+    return response
+
+def feedURL(fmt, page=None):
+    """Return the URL for the current feed, or the given archive page, in the given format
+    """
+    if page is None:
+        url = '/'
+        if fmt != 'html':
+            url = '/feed.%s' % fmt
+    else:
+        url = '/archive/%d' % page
+        if fmt != 'html':
+            url += '.%s' % fmt
+    return url
+
+def feedItem(fmt, entry):
+    """Serialize a single entry for the given feed format
+    """
+    url       = entryURL(entry)
+    published = entry['date'].strftime('%Y-%m-%dT%H:%M:%SZ')
+    if fmt == 'html':
+        return app.jinja_env.get_template('article.jinja').render(entry=entry)
+    elif fmt == 'atom':
+        return ('<entry><title>%s</title><link rel="alternate" type="text/html" href=%s/>'
+                '<id>%s</id><published>%s</published><updated>%s</updated>'
+                '<content type="text">%s</content></entry>\n') % (escape(entry['title']), quoteattr(url),
+                escape(url), published, published, escape(entry['text']))
+    else:
+        return json.dumps({ 'id':             url,
+                            'url':            url,
+                            'title':          entry['title'],
+                            'content_text':   entry['text'],
+                            'date_published': published,
+                          }, sort_keys=True)
+
+def feedTitle():
+    """Return the site title from the config, templateData is changed per page
+    """
+    return buildTemplateContext(cfg)['title'] or cfg.our_domain
+
+def feedDocument(fmt, items, modified, page=None, archives=0):
+    """Assemble a feed document from already serialized items (newest first).
+
+    The current feed (page is None) links to the newest archive page, archive
+    pages link to their neighbours following RFC 5005.
+    """
+    links = { 'current': feedURL(fmt) }
+    if page is None:
+        if archives > 0:
+            links['prev-archive'] = feedURL(fmt, archives)
+    else:
+        if page > 1:
+            links['prev-archive'] = feedURL(fmt, page - 1)
+        if page < archives:
+            links['next-archive'] = feedURL(fmt, page + 1)
+    selfURL = feedURL(fmt, page)
+
+    if fmt == 'html':
+        body = ''.join(items)
+    elif fmt == 'atom':
+        if modified is None:
+            updated = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        else:
+            updated = modified.strftime('%Y-%m-%dT%H:%M:%SZ')
+        header = ['<?xml version="1.0" encoding="utf-8"?>',
+                  '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:fh="http://purl.org/syndication/history/1.0">',
+                  '<title>%s</title>' % escape(feedTitle()),
+                  '<id>%s%s</id>' % (cfg.baseurl, selfURL),
+                  '<updated>%s</updated>' % updated,
+                  '<author><name>%s</name></author>' % escape(cfg.our_domain),
+                  '<link rel="self" href=%s/>' % quoteattr('%s%s' % (cfg.baseurl, selfURL)),
+                  '<link rel="alternate" type="text/html" href=%s/>' % quoteattr('%s/' % cfg.baseurl)]
+        for rel in sorted(links):
+            if rel != 'current' or page is not None:
+                header.append('<link rel="%s" href=%s/>' % (rel, quoteattr('%s%s' % (cfg.baseurl, links[rel]))))
+        if page is not None:
+            header.append('<fh:archive/>')
+        body = '%s\n%s</feed>\n' % ('\n'.join(header), ''.join(items))
+    else:
+        header = { 'version':       'https://jsonfeed.org/version/1',
+                   'title':         feedTitle(),
+                   'home_page_url': '%s/' % cfg.baseurl,
+                   'feed_url':      '%s%s' % (cfg.baseurl, selfURL),
+                 }
+        if 'prev-archive' in links:
+            header['next_url'] = '%s%s' % (cfg.baseurl, links['prev-archive'])
+        body = '%s, "items": [%s]}' % (json.dumps(header, sort_keys=True)[:-1], ', '.join(items))
+
+    if isinstance(body, unicode):
+        digest = hashlib.sha1(body.encode('utf-8'))
+    else:
+        digest = hashlib.sha1(body)
+    digest.update(json.dumps(links, sort_keys=True))
+
+    return { 'body':     body,
+             'links':    links,
+             'etag':     digest.hexdigest(),
+             'modified': modified,
+           }
+
+def buildArchive(fmt, page, pageSize):
+    """Build the archive page holding the page'th complete block of pageSize entries
+    """
+    items = feedItems[fmt][(page - 1) * pageSize:page * pageSize]
+    items.reverse()
+    feedArchives[fmt][page] = feedDocument(fmt, items, entries[page * pageSize - 1]['date'],
+                                           page=page, archives=len(entries) // pageSize)
+
+def buildCurrent(fmt, pageSize):
+    """Build the current feed from the newest pageSize serialized entries
+    """
+    items = feedItems[fmt][-pageSize:]
+    items.reverse()
+    if entries:
+        modified = entries[-1]['date']
+    else:
+        modified = None
+    feedCurrent[fmt] = feedDocument(fmt, items, modified, archives=len(entries) // pageSize)
+
+def addFeedEntry(entry):
+    """Serialize the new entry once per feed format and prepend it to the current feeds.
+
+    Only the current feed, and when a block of feed_page_size entries is
+    completed the new archive page and the one before it, are rebuilt.
+    """
+    pageSize = cfg.feed_page_size
+    for fmt in feedFormats:
+        feedItems[fmt].append(feedItem(fmt, entry))
+        if len(entries) % pageSize == 0:
+            page = len(entries) // pageSize
+            buildArchive(fmt, page, pageSize)
+            if page > 1:
+                buildArchive(fmt, page - 1, pageSize)
+        buildCurrent(fmt, pageSize)
+
+def buildFeeds():
+    """Rebuild every feed document from entries
+    """
+    pageSize = cfg.feed_page_size
+    for fmt in feedFormats:
+        feedItems[fmt]    = [ feedItem(fmt, entry) for entry in entries ]
+        feedArchives[fmt] = {}
+        for page in range(1, len(entries) // pageSize + 1):
+            buildArchive(fmt, page, pageSize)
+        buildCurrent(fmt, pageSize)
+
+def pageETag(etag):
+    """Return the ETag of an html page showing content with the given ETag,
+    it also changes with the asset manifest and the template context
+    """
+    digest = hashlib.sha1(etag)
+    digest.update(json.dumps(assetFiles, sort_keys=True))
+    digest.update(json.dumps(buildTemplateContext(cfg), sort_keys=True))
+    return digest.hexdigest()
+
+def cachedETag(etag, modified):
+    """Return the ETag of the copy the client already has if it is current,
+    either etag or, for a compressed response, etag with the encoding
+    appended (see compressResponse). Returns None if it has to be sent.
+    """
+    encoding = acceptedEncoding()
+    if encoding is not None and '%s-%s' % (etag, encoding) in request.if_none_match:
+        return '%s-%s' % (etag, encoding)
+    if not is_resource_modified(request.environ, etag, last_modified=modified):
+        return etag
+    return None
+
+def serveFeed(fmt, page=None):
+    """Return a conditional (ETag and Last-Modified based) response for the given feed
+
+    The conditional request is checked before the html page is rendered.
+    """
+    if page is None:
+        if fmt not in feedCurrent:
+            buildFeeds()
+        feed = feedCurrent[fmt]
+    elif page in feedArchives[fmt]:
+        feed = feedArchives[fmt][page]
+    else:
+        return 'archive page not found', 404
+
+    etag = feed['etag']
+    if fmt == 'html':
+        etag = pageETag(etag)
+    cached = cachedETag(etag, feed['modified'])
+    if cached is not None:
+        response = make_response('', 304)
+        etag     = cached
+    elif fmt == 'html':
+        response = make_response(renderTemplate('index.jinja', feed=Markup(feed['body']), links=feed['links'], **templateData))
+    else:
+        response = make_response(feed['body'])
+    if fmt == 'atom':
+        response.mimetype = 'application/atom+xml'
+    elif fmt == 'json':
+        response.mimetype = 'application/json'
+    if page is None:
+        response.headers['Cache-Control'] = 'public, no-cache'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+    response.set_etag(etag)
+    if feed['modified'] is not None:
+        response.last_modified = feed['modified']
+    return response.make_conditional(request)
+
 @app.route('/article<article>', methods=['GET'])
 def handleArticles(article):
     app.logger.info('handleArticles %s article%s' % (request.method, article))
 
-    templateData['entries'] = entries
-    return render_template('index.jinja', **templateData)
+    cached = entryIndex.get(normalizeURL('%s/article%s' % (cfg.baseurl, article)))
+    if cached is None:
+        return 'article not found', 404
+    return renderTemplate('index.jinja', feed=Markup(feedItem('html', cached['entry'])), links={}, **templateData)
+
+@app.route('/feed.<fmt>', methods=['GET'])
+def handleFeed(fmt):
+    app.logger.info('handleFeed [%s] %s' % (request.method, fmt))
+
+    if fmt not in ('atom', 'json'):
+        return 'unknown feed format', 404
+    return serveFeed(fmt)
+
+@app.route('/archive/<int:page>', methods=['GET'])
+@app.route('/archive/<int:page>.<fmt>', methods=['GET'])
+def handleArchive(page, fmt='html'):
+    app.logger.info('handleArchive [%s] %d %s' % (request.method, page, fmt))
+
+    if fmt not in feedFormats:
+        return 'unknown feed format', 404
+    return serveFeed(fmt, page)
 
 @app.route('/', methods=['GET'])
 def handleRoot():
     app.logger.info('handleRoot [%s]' % request.method)
 
-    templateData['entries'] = entries
-    return render_template('index.jinja', **templateData)
+    return serveFeed('html')
 
 def initLogging(logger, logpath=None, echo=False):
     logFormatter = logging.Formatter("%(asctime)s %(levelname)-9s %(message)s", "%Y-%m-%d %H:%M:%S")
@@ -536,9 +1505,52 @@ def loadConfig(configFilename, host=None, port=None, basepath=None, logpath=None
         result.auth_timeout = 300
     if 'require_vouch' not in result:
         result.require_vouch = False
+    if 'syndicate_to' not in result:
+        result.syndicate_to = []
+    if 'domain_aliases' not in result:
+        result.domain_aliases = []
+    if 'compress_min_size' not in result:
+        result.compress_min_size = 1024
+    if 'feed_page_size' not in result:
+        result.feed_page_size = 20
+    if 'request_budget' not in result:
+        result.request_budget = 10
+    if 'outbound_timeout' not in result:
+        result.outbound_timeout = result.request_budget / 2.0
+    if 'breaker_threshold' not in result:
+        result.breaker_threshold = 5
+    if 'breaker_cooldown' not in result:
+        result.breaker_cooldown = 60
+    if 'max_redirects' not in result:
+        result.max_redirects = 5
+    if 'session_timeout' not in result:
+        result.session_timeout = result.auth_timeout
+    if 'token_timeout' not in result:
+        result.token_timeout = 60 * 60 * 24 * 90
+    if 'profile_secret' not in result:
+        result.profile_secret = None
+    if 'profile_sample_rate' not in result:
+        result.profile_sample_rate = 0
+    if 'profile_path' not in result:
+        result.profile_path = os.path.join(result.logpath or '.', 'profiles')
+    # send_from_directory() resolves a relative path against the app, not the cwd
+    result.profile_path = os.path.abspath(result.profile_path)
+    if 'profile_keep' not in result:
+        result.profile_keep = 20
+    if result.profile_keep < 1:
+        raise ValueError('profile_keep must be at least 1')
+    if 'slow_request_ms' not in result:
+        result.slow_request_ms = 1000
 
     return result
 
+class TimedRedis(redis.StrictRedis):
+    """StrictRedis that adds the time spent in each command to the redis phase of the request
+    """
+    def execute_command(self, *args, **options):
+        with phase('redis'):
+            return super(TimedRedis, self).execute_command(*args, **options)
+
 def getRedis(cfgRedis):
     if 'host' not in cfgRedis:
         cfgRedis.host = '127.0.0.1'
@@ -547,7 +1559,144 @@ def getRedis(cfgRedis):
     if 'db' not in cfgRedis:
         cfgRedis.db = 0
 
-    return redis.StrictRedis(host=cfgRedis.host, port=cfgRedis.port, db=cfgRedis.db)
+    return TimedRedis(host=cfgRedis.host, port=cfgRedis.port, db=cfgRedis.db)
+
+keyFamilies = (('l:',       'login'),
+               ('s:',       'session token'),
+               ('a:',       'app'),
+               ('t:',       'access token'),
+               ('login-',   'legacy login'),
+               ('token-',   'legacy token'),
+               ('app-',     'legacy app'),
+               ('breaker-', 'circuit breaker'),
+               ('metrics',  'metrics'),
+              )
+
+def keyFamily(key):
+    for prefix, family in keyFamilies:
+        if key.startswith(prefix):
+            return family
+    return 'other'
+
+def legacyScope(scope):
+    """Return the scope stored in an old app- key.
+
+    Those keys were built from the parse_qs() result of the auth code
+    validation, so the scope is the repr of a list, e.g. ['post'].
+    Returns None if it is not a single scope.
+    """
+    if not scope.startswith('['):
+        return scope
+    try:
+        value = ast.literal_eval(scope)
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(value, list) or len(value) != 1 or not isinstance(value[0], basestring) or not value[0]:
+        return None
+    return str(value[0])
+
+def parseAppKey(key):
+    """Split an old app-<me>-<client_id>-<scope> key into me, client_id and scope.
+
+    Both me and client_id are URLs that may contain dashes, so the key is
+    split where a dash is followed by http:// or https://. Returns None
+    if the key can not be split that way unambiguously.
+    """
+    body = key[len('app-'):]
+    if '-' not in body:
+        return None
+    rest, scope = body.rsplit('-', 1)
+    scope       = legacyScope(scope)
+    parts       = re.split(r'-(?=https?://)', rest)
+    if len(parts) != 2 or not scope or not re.match(r'https?://.', parts[0]) or not re.match(r'https?://.', parts[1]):
+        return None
+    return parts[0], parts[1], scope
+
+def compactRedis(r, config, batch=500):
+    """Convert auth data stored with the old login-, token- and app- keys
+    to the compact key schema (see hashKey) and give every key a TTL.
+
+    Keys are found with SCAN and converted one at a time so this can run
+    against a live instance. Returns the number of keys converted or
+    removed for each old key family and the app keys that were skipped
+    because they could not be parsed, those (and their token- keys) are
+    left in place.
+    """
+    counts  = { 'app': 0, 'login': 0, 'token': 0 }
+    skipped = []
+
+    for key in r.scan_iter(match='app-*', count=batch):
+        token = r.get(key)
+        try:
+            tokenBytes = uuid.UUID(token).bytes
+        except (TypeError, ValueError, AttributeError):
+            tokenBytes = None
+        if tokenBytes is not None:
+            data = parseAppKey(key)
+            if data is None:
+                app.logger.warning('unable to parse %s, skipping it' % key)
+                skipped.append(key)
+                continue
+            me, client_id, scope = data
+            storeAccessToken(r, hashKey('a:', me, client_id, scope), tokenBytes,
+                             me, client_id, scope, config.token_timeout)
+            r.delete('token-%s' % token)
+        r.delete(key)
+        counts['app'] += 1
+
+    for key in r.scan_iter(match='login-*', count=batch):
+        data = r.hgetall(key)
+        ttl  = r.ttl(key)
+        if data:
+            newKey = loginKey(key[len('login-'):])
+            r.hmset(newKey, { 'f': data.get('from_uri') or '',
+                              'r': data.get('redirect_uri', ''),
+                              'c': data.get('client_id', ''),
+                              's': data.get('scope', ''),
+                            })
+            if 'token' in data:
+                try:
+                    tokenBytes = uuid.UUID(data['token']).bytes
+                except ValueError:
+                    tokenBytes = None
+                if tokenBytes is not None:
+                    r.hset(newKey, 't', tokenBytes)
+                    r.set('s:%s' % tokenBytes, newKey, ex=config.session_timeout)
+                r.delete('token-%s' % data['token'])
+                r.expire(newKey, config.session_timeout)
+            else:
+                r.expire(newKey, ttl if ttl > 0 else config.auth_timeout)
+        r.delete(key)
+        counts['login'] += 1
+
+    # any token- keys left, other than those of skipped app keys,
+    # no longer have a login or app key to refer to
+    for key in r.scan_iter(match='token-*', count=batch):
+        if r.get(key) not in skipped:
+            r.delete(key)
+            counts['token'] += 1
+
+    return counts, skipped
+
+def redisReport(r, batch=500):
+    """Measure the memory used by each key family
+    """
+    report = {}
+    for key in r.scan_iter(count=batch):
+        family = report.setdefault(keyFamily(key), { 'keys': 0, 'bytes': 0, 'persistent': 0, 'encodings': {} })
+        try:
+            size = r.execute_command('MEMORY', 'USAGE', key)
+        except redis.ResponseError:
+            size = r.debug_object(key).get('serializedlength', 0)
+        ttl      = r.ttl(key)
+        encoding = r.object('encoding', key)
+
+        family['keys']  += 1
+        family['bytes'] += size or 0
+        if ttl is None or ttl < 0:
+            family['persistent'] += 1
+        family['encodings'][encoding] = family['encodings'].get(encoding, 0) + 1
+    return report
 
 def buildTemplateContext(config):
     result = {}
@@ -567,11 +1716,14 @@ def doStart(app, configFile, ourHost=None, ourPort=None, ourBasePath=None, ourPa
     initLogging(app.logger, _cfg.logpath, echo=echo)
     if 'redis' in _cfg:
         _db = getRedis(_cfg.redis)
+    loadAssets(assetPath)
     return _cfg, _db
 
 if _uwsgi:
     cfg, db = doStart(app, _configFile, _ourPath)
     templateData = buildTemplateContext(cfg)
+    buildMicropubQueries(cfg)
+    buildURLAliases(cfg)
 #
 # None of the below will be run for nginx + uwsgi
 #
@@ -584,17 +1736,43 @@ if __name__ == '__main__':
     parser.add_argument('--logpath',  default='/var/log')
     parser.add_argument('--basepath', default='/var/www')
     parser.add_argument('--config',   default='/etc/indieweb.cfg')
+    parser.add_argument('--buildassets', action='store_true', help='fingerprint and precompress the static assets and exit')
+    parser.add_argument('--compactredis', action='store_true', help='convert stored auth data to the compact key schema and exit')
+    parser.add_argument('--redisreport',  action='store_true', help='report the memory used by each Redis key family and exit')
 
     args = parser.parse_args()
 
+    if args.buildassets:
+        for name, assetName in sorted(buildAssets(staticPath, assetPath).items()):
+            print('%s -> %s' % (name, assetName))
+        sys.exit(0)
+
+    if args.compactredis or args.redisreport:
+        cfg = loadConfig(args.config, args.host, args.port, args.basepath, args.logpath)
+        db  = getRedis(cfg.redis)
+        if args.compactredis:
+            counts, skipped = compactRedis(db, cfg)
+            for family, count in sorted(counts.items()):
+                print('%-8s %8d keys converted' % (family, count))
+            for key in skipped:
+                print('skipped %s' % key)
+        else:
+            print('%-16s %8s %10s %8s %10s  %s' % ('family', 'keys', 'bytes', 'avg', 'no ttl', 'encodings'))
+            for family, data in sorted(redisReport(db).items()):
+                print('%-16s %8d %10d %8d %10d  %s' % (family, data['keys'], data['bytes'], data['bytes'] // data['keys'],
+                                                        data['persistent'], ', '.join('%s:%d' % item for item in sorted(data['encodings'].items()))))
+        sys.exit(0)
+
     cfg, db = doStart(app, args.config, args.host, args.port, args.basepath, args.logpath, echo=True)
     templateData = buildTemplateContext(cfg)
+    buildMicropubQueries(cfg)
+    buildURLAliases(cfg)
 
     for i in range(1, 3):
-        entries.append({ 'title': 'Article %d' % i,
-                         'slug':  'article%d' % i,
-                         'date':  datetime.datetime(2015,1,i, 10, 0, 0),
-                         'text':  'test article %d' % i
-                       })
+        addEntry({ 'title': 'Article %d' % i,
+                   'slug':  'article%d' % i,
+                   'date':  datetime.datetime(2015,1,i, 10, 0, 0),
+                   'text':  'test article %d' % i
+                 })
 
     app.run(host=cfg.host, port=cfg.port, debug=True)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+:copyright: (c) 2015 by Mike Taylor
+:license: MIT, see LICENSE for more details.
+
+Helpers for the tests that drive the app through the Flask test client
+instead of a running server. Redis is replaced by fakeredis.
+"""
+
+import os, sys
+import io
+import uuid
+import datetime
+
+import requests
+import fakeredis
+
+from requests.structures import CaseInsensitiveDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indieweb
+
+
+def setupApp(entryCount=3, **config):
+    """Load indieweb.cfg, apply any config overrides, reset all
+    module state and publish entryCount entries.
+
+    Returns a Flask test client.
+    """
+    indieweb.cfg = indieweb.loadConfig(os.path.join(os.path.dirname(indieweb.__file__), 'indieweb.cfg'))
+    for key in config:
+        indieweb.cfg[key] = config[key]
+    indieweb.db = fakeredis.FakeStrictRedis()
+    indieweb.db.flushall()
+    indieweb.templateData = indieweb.buildTemplateContext(indieweb.cfg)
+
+    del indieweb.entries[:]
+    indieweb.entryIndex.clear()
+    indieweb.feedCurrent.clear()
+    for fmt in indieweb.feedFormats:
+        indieweb.feedItems[fmt]    = []
+        indieweb.feedArchives[fmt] = {}
+    indieweb.breakers.clear()
+    indieweb.metrics.clear()
+
+    indieweb.buildMicropubQueries(indieweb.cfg)
+    indieweb.buildURLAliases(indieweb.cfg)
+    for i in range(1, entryCount + 1):
+        indieweb.addEntry({ 'title': 'Article %d' % i,
+                            'slug':  'article%d' % i,
+                            'date':  datetime.datetime(2015,1,i, 10, 0, 0),
+                            'text':  'test article %d' % i
+                          })
+    return indieweb.app.test_client()
+
+def accessToken(me='http://giudici.us', client_id='https://quill.p3k.io', scope='post'):
+    """Store an access token for me and return it
+    """
+    token = uuid.uuid4()
+    indieweb.storeAccessToken(indieweb.db, indieweb.hashKey('a:', me, client_id, scope), token.bytes,
+                              me, client_id, scope, indieweb.cfg.token_timeout)
+    return str(token)
+
+def fakeResponse(url, body='', status=200, headers=None, raw=None):
+    """Return a requests Response for url whose body is read from raw, or body
+    """
+    r             = requests.models.Response()
+    r.url         = url
+    r.status_code = status
+    r.headers     = CaseInsensitiveDict(headers or { 'content-type': 'text/html; charset=utf-8' })
+    r.raw         = raw or io.BytesIO(body)
+    r.encoding    = 'utf-8'
+    return r
+
+def loginSession(client, me='http://giudici.us', token=None):
+    """Store login data for me the way handleLoginSuccess() does and put
+    token (a new one if not given) in the session of client
+    """
+    if token is None:
+        token = str(uuid.uuid4())
+        key   = indieweb.loginKey(me)
+        indieweb.db.hmset(key, { 'f': '', 'r': 'http://localhost:9999/success', 'c': 'giudici.us', 's': 'post',
+                                 't': uuid.UUID(token).bytes })
+        indieweb.db.set('s:%s' % uuid.UUID(token).bytes, key, ex=indieweb.cfg.session_timeout)
+    with client.session_transaction() as session:
+        session['indieauth_id']    = me
+        session['indieauth_token'] = token
+    return token
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+:copyright: (c) 2015 by Mike Taylor
+:license: MIT, see LICENSE for more details.
+
+Compare the bytes transferred for a page view of / with and without
+fingerprinted, precompressed assets and compressed html responses.
+
+Run from the repository root (make bench).
+"""
+
+import os, sys
+import datetime
+
+sys.path.insert(0, os.getcwd())
+
+import indieweb
+
+
+def pageView(client, headers, cssURL, cached):
+    """Return the (requests, bytes) needed to view / and its stylesheet.
+    When cached is True a stylesheet with an immutable Cache-Control is not
+    requested again and one without it is revalidated.
+    """
+    r        = client.get('/', headers=headers)
+    requests = 1
+    size     = len(r.data)
+    if cached:
+        if cssURL.startswith('/static/build/'):
+            return requests, size
+        etag = client.get(cssURL, headers=headers).headers.get('ETag')
+        r    = client.get(cssURL, headers=dict(headers, **{ 'If-None-Match': etag }))
+    else:
+        r = client.get(cssURL, headers=headers)
+    return requests + 1, size + len(r.data)
+
+if __name__ == '__main__':
+    indieweb.cfg          = indieweb.loadConfig(os.path.join(os.getcwd(), 'indieweb.cfg'))
+    indieweb.templateData = indieweb.buildTemplateContext(indieweb.cfg)
+    indieweb.buildMicropubQueries(indieweb.cfg)
+    indieweb.buildURLAliases(indieweb.cfg)
+    for i in range(1, 21):
+        indieweb.addEntry({ 'title': 'Article %d' % i,
+                            'slug':  'article%d' % i,
+                            'date':  datetime.datetime(2015,1,i, 10, 0, 0),
+                            'text':  'test article %d' % i
+                          })
+    client = indieweb.app.test_client()
+
+    indieweb.loadAssets(os.path.join(indieweb.staticPath, 'nonexistent'))
+    indieweb.cfg.compress_min_size = sys.maxint
+    before = (pageView(client, {}, indieweb.assetURL('main.css'), False),
+              pageView(client, {}, indieweb.assetURL('main.css'), True))
+
+    indieweb.buildAssets(indieweb.staticPath, indieweb.assetPath)
+    indieweb.loadAssets(indieweb.assetPath)
+    indieweb.cfg.compress_min_size = 1024
+    headers = { 'Accept-Encoding': 'gzip, deflate, br' }
+    after   = (pageView(client, headers, indieweb.assetURL('main.css'), False),
+               pageView(client, headers, indieweb.assetURL('main.css'), True))
+
+    print('%-8s %-12s %8s %8s' % ('', 'view', 'requests', 'bytes'))
+    for label, (first, repeat) in (('before', before), ('after', after)):
+        print('%-8s %-12s %8d %8d' % (label, 'first',  first[0],  first[1]))
+        print('%-8s %-12s %8d %8d' % (label, 'repeat', repeat[0], repeat[1]))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+:copyright: (c) 2015 by Mike Taylor
+:license: MIT, see LICENSE for more details.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from appsetup import setupApp
+
+import indieweb
+
+class TestCompressedETag(unittest.TestCase):
+    def runTest(self):
+        client = setupApp(entryCount=20)
+
+        plain = client.get('/')
+        gz    = client.get('/', headers={ 'Accept-Encoding': 'gzip' })
+
+        assert plain.status_code == 200
+        assert gz.status_code    == 200
+        assert gz.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in gz.headers['Vary']
+        assert gz.headers['ETag'] != plain.headers['ETag']
+
+        r = client.get('/', headers={ 'Accept-Encoding': 'gzip', 'If-None-Match': gz.headers['ETag'] })
+
+        assert r.status_code == 304
+
+        r = client.get('/', headers={ 'If-None-Match': plain.headers['ETag'] })
+
+        assert r.status_code == 304
+
+class TestPrecompressedAssets(unittest.TestCase):
+    def setUp(self):
+        self.staticPath = indieweb.staticPath
+        indieweb.staticPath = tempfile.mkdtemp()
+        with open('%s/main.css' % indieweb.staticPath, 'w') as h:
+            h.write('body { margin: 0; }\n' * 100)
+        indieweb.buildAssets(indieweb.staticPath, '%s/build' % indieweb.staticPath)
+        indieweb.loadAssets('%s/build' % indieweb.staticPath)
+
+    def tearDown(self):
+        shutil.rmtree(indieweb.staticPath)
+        indieweb.staticPath = self.staticPath
+        indieweb.loadAssets(indieweb.assetPath)
+
+    def runTest(self):
+        client = setupApp()
+        url    = indieweb.assetURL('main.css')
+
+        assert url.startswith('/static/build/main.')
+
+        r = client.get(url, headers={ 'Accept-Encoding': 'gzip' })
+
+        assert r.status_code == 200
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert r.mimetype == 'text/css'
+        assert 'immutable' in r.headers['Cache-Control']
+
+        r = client.get('%s.gz' % url)
+
+        assert r.status_code == 404
+
+        r = client.get('/static/build/assets.json')
+
+        assert r.status_code == 200
+        assert 'immutable' not in r.headers.get('Cache-Control', '')
+
+class TestPruneAssets(unittest.TestCase):
+    def setUp(self):
+        self.sourcePath = tempfile.mkdtemp()
+        self.buildPath  = os.path.join(self.sourcePath, 'build')
+        os.makedirs(os.path.join(self.sourcePath, 'css'))
+
+    def tearDown(self):
+        shutil.rmtree(self.sourcePath)
+
+    def build(self, files):
+        for name in files:
+            with open(os.path.join(self.sourcePath, name), 'w') as h:
+                h.write(files[name])
+        return indieweb.buildAssets(self.sourcePath, self.buildPath)
+
+    def built(self):
+        result = []
+        for root, dirs, files in os.walk(self.buildPath):
+            for filename in files:
+                result.append(os.path.relpath(os.path.join(root, filename), self.buildPath))
+        return sorted(result)
+
+    def runTest(self):
+        old = self.build({ 'main.css': 'body { margin: 0; }', 'css/extra.css': 'p { margin: 0; }' })
+        os.remove(os.path.join(self.sourcePath, 'css', 'extra.css'))
+        new = self.build({ 'main.css': 'body { margin: 1px; }' })
+
+        assert new['main.css'] != old['main.css']
+        assert 'css/extra.css' not in new
+        expected = [ 'assets.json', new['main.css'], '%s.gz' % new['main.css'] ]
+        if indieweb._brotli:
+            expected.append('%s.br' % new['main.css'])
+        assert self.built() == sorted(expected)
+        assert not os.path.exists(os.path.join(self.buildPath, 'css'))
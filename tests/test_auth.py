@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+:copyright: (c) 2015 by Mike Taylor
+:license: MIT, see LICENSE for more details.
+"""
+
+import uuid
+import urllib
+import unittest
+import urlparse
+
+import requests
+
+from appsetup import setupApp, fakeResponse
+
+import indieweb
+
+me        = 'http://me.example'
+client_id = 'https://quill.p3k.io'
+
+class TestKeySchema(unittest.TestCase):
+    def setUp(self):
+        self.get              = requests.get
+        self.validateAuthCode = indieweb.validateAuthCode
+        requests.get          = lambda url, **kwargs: fakeResponse(url, '<link rel="authorization_endpoint" href="https://auth.example/auth">')
+        indieweb.validateAuthCode = lambda **kwargs: { 'status': 200, 'response': { 'scope': 'post' } }
+        indieweb.app.config['WTF_CSRF_ENABLED'] = False
+
+    def tearDown(self):
+        requests.get              = self.get
+        indieweb.validateAuthCode = self.validateAuthCode
+        indieweb.app.config['WTF_CSRF_ENABLED'] = True
+
+    def runTest(self):
+        client = setupApp(auth_timeout=300, session_timeout=3600, token_timeout=86400)
+        db     = indieweb.db
+
+        r = client.post('/login', data={ 'me': me, 'client_id': 'giudici.us', 'redirect_uri': 'http://localhost:9999/success' })
+
+        assert r.status_code == 302
+        assert r.headers['Location'].startswith('https://auth.example/auth?')
+        key = indieweb.loginKey(me)
+        assert len(key) == 14
+        assert 0 < db.ttl(key) <= 300
+
+        r = client.get('/success?me=%s&code=abc' % me)
+
+        assert r.status_code == 302
+        with client.session_transaction() as session:
+            token = session['indieauth_token']
+        tokenKey = 's:%s' % uuid.UUID(token).bytes
+        assert 300 < db.ttl(key) <= 3600
+        assert 300 < db.ttl(tokenKey) <= 3600
+        assert db.get(tokenKey) == key
+
+        assert client.get('/auth?token=%s' % token).status_code == 200
+        assert client.get('/auth?token=%s' % uuid.uuid4()).status_code == 403
+        assert client.get('/auth?token=not-a-token').status_code == 403
+
+        r = client.post('/token', data={ 'code': 'abc', 'me': me, 'client_id': client_id,
+                                         'redirect_uri': 'https://quill.p3k.io/auth/callback', 'state': '1' })
+
+        assert r.status_code == 200
+        params      = dict(urlparse.parse_qsl(r.data))
+        accessToken = params['access_token']
+        assert params['scope'] == 'post'
+        assert 3600 < db.ttl('t:%s' % uuid.UUID(accessToken).bytes) <= 86400
+        assert 3600 < db.ttl(indieweb.hashKey('a:', me, client_id, 'post')) <= 86400
+
+        # the same app gets the same token back
+        r = client.post('/token', data={ 'code': 'abc', 'me': me, 'client_id': client_id,
+                                         'redirect_uri': 'https://quill.p3k.io/auth/callback', 'state': '1' })
+
+        assert dict(urlparse.parse_qsl(r.data))['access_token'] == accessToken
+
+        r = client.get('/token', headers={ 'Authorization': 'Bearer %s' % accessToken })
+
+        assert r.status_code == 200
+        assert dict(urlparse.parse_qsl(r.data)) == { 'me': me, 'client_id': client_id, 'scope': 'post' }
+
+        for key in db.keys():
+            assert db.ttl(key) > 0, key
+
+class TestCompactRedis(unittest.TestCase):
+    def setUp(self):
+        self.validateAuthCode     = indieweb.validateAuthCode
+        indieweb.validateAuthCode = lambda **kwargs: { 'status': 200, 'response': { 'scope': 'post' } }
+
+    def tearDown(self):
+        indieweb.validateAuthCode = self.validateAuthCode
+
+    def runTest(self):
+        client = setupApp()
+        db     = indieweb.db
+
+        # the old /token stored the scope as the repr of the parse_qs() list
+        token   = str(uuid.uuid4())
+        appKey  = "app-http://my-site.example-https://quill.p3k.io-['post']"
+        db.set(appKey, token)
+        db.set('token-%s' % token, appKey)
+
+        badToken = str(uuid.uuid4())
+        badKey   = "app-http://my-site.example-my-client-['post']"
+        db.set(badKey, badToken)
+        db.set('token-%s' % badToken, badKey)
+
+        counts, skipped = indieweb.compactRedis(db, indieweb.cfg)
+
+        assert counts['app'] == 1
+        assert skipped == [ badKey ]
+        assert db.get(badKey) == badToken
+        assert db.get('token-%s' % badToken) == badKey
+        assert db.get(appKey) is None
+        assert db.get('token-%s' % token) is None
+        assert db.get(indieweb.hashKey('a:', 'http://my-site.example', 'https://quill.p3k.io', 'post')) == uuid.UUID(token).bytes
+
+        r = client.get('/token', headers={ 'Authorization': 'Bearer %s' % token })
+
+        assert r.status_code == 200
+        assert dict(urlparse.parse_qsl(r.data)) == { 'me':        'http://my-site.example',
+                                                     'client_id': 'https://quill.p3k.io',
+                                                     'scope':     'post' }
+
+        # the next code exchange for the same app finds the migrated token
+        r = client.post('/token', data={ 'code': 'abc', 'me': 'http://my-site.example', 'client_id': 'https://quill.p3k.io',
+                                         'redirect_uri': 'https://quill.p3k.io/auth/callback', 'state': '1' })
+
+        assert r.status_code == 200
+        assert dict(urlparse.parse_qsl(r.data))['access_token'] == token
+
+        r = client.get('/token', headers={ 'Authorization': 'Bearer %s' % badToken })
+
+        assert r.status_code == 400
+
+class TestParseAppKey(unittest.TestCase):
+    def runTest(self):
+        assert indieweb.parseAppKey('app-https://a-b.example/c-d-http://e-f.example-post') == \
+               ('https://a-b.example/c-d', 'http://e-f.example', 'post')
+        assert indieweb.parseAppKey('app-http://a.example-http://b.example-http://c.example-post') is None
+        assert indieweb.parseAppKey('app-giudici.us-http://b.example-post') is None
+        assert indieweb.parseAppKey('app-http://a.example-http://b.example-') is None
+        assert indieweb.parseAppKey("app-http://a.example-http://b.example-['post']") == ('http://a.example', 'http://b.example', 'post')
+        assert indieweb.parseAppKey("app-http://a.example-http://b.example-[u'post']") == ('http://a.example', 'http://b.example', 'post')
+        assert indieweb.parseAppKey("app-http://a.example-http://b.example-['post', 'edit']") is None
+        assert indieweb.parseAppKey("app-http://a.example-http://b.example-[]") is None
+        assert indieweb.parseAppKey("app-http://a.example-http://b.example-['post'") is None
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+:copyright: (c) 2015 by Mike Taylor
+:license: MIT, see LICENSE for more details.
+"""
+
+import json
+import unittest
+import datetime
+
+import requests
+
+from appsetup import setupApp
+
+import indieweb
+
+class TestFeeds(unittest.TestCase):
+    def runTest(self):
+        for url, contentType in (('http://127.0.0.1:9999/',          'text/html'),
+                                 ('http://127.0.0.1:9999/feed.atom', 'application/atom+xml'),
+                                 ('http://127.0.0.1:9999/feed.json', 'application/json')):
+            r = requests.get(url)
+
+            assert r.status_code == 200
+            assert r.headers['content-type'].startswith(contentType)
+            assert 'etag' in r.headers
+
+            r = requests.get(url, headers={ 'If-None-Match': r.headers['etag'] })
+
+            assert r.status_code == 304
+
+class TestArchive(unittest.TestCase):
+    def runTest(self):
+        r = requests.get('http://127.0.0.1:9999/archive/0.atom')
+
+        assert r.status_code == 404
+
+class TestArticlePage(unittest.TestCase):
+    def runTest(self):
+        client = setupApp(entryCount=5)
+
+        r = client.get('/article3')
+
+        assert r.status_code == 200
+        assert r.data.count('class="post h-entry') == 1
+        assert 'Article 3' in r.data
+
+        r = client.get('/article9')
+
+        assert r.status_code == 404
+
+class TestFeedTitle(unittest.TestCase):
+    def runTest(self):
+        client = setupApp(entryCount=1)
+
+        r = client.get('/login')
+
+        assert r.status_code == 200
+
+        indieweb.addEntry({ 'title': 'Article 2',
+                            'slug':  'article2',
+                            'date':  datetime.datetime(2015,1,2, 10, 0, 0),
+                            'text':  'test article 2'
+                          })
+
+        assert '<title>Sign In</title>' not in client.get('/feed.atom').data
+        assert json.loads(client.get('/feed.json').data)['title'] != 'Sign In'
+
+class TestPageETag(unittest.TestCase):
+    def setUp(self):
+        self.assetFiles     = dict(indieweb.assetFiles)
+        self.renderTemplate = indieweb.renderTemplate
+        self.rendered       = []
+
+        def renderTemplate(template, **context):
+            self.rendered.append(template)
+            return self.renderTemplate(template, **context)
+        indieweb.renderTemplate = renderTemplate
+
+    def tearDown(self):
+        indieweb.renderTemplate = self.renderTemplate
+        indieweb.assetFiles.clear()
+        indieweb.assetFiles.update(self.assetFiles)
+
+    def runTest(self):
+        client = setupApp(entryCount=20)
+        indieweb.assetFiles['main.css'] = 'main.0123456789.css'
+
+        r    = client.get('/')
+        etag = r.headers['ETag']
+        assert '/static/build/main.0123456789.css' in r.data
+
+        gz = client.get('/', headers={ 'Accept-Encoding': 'gzip' })
+        assert len(self.rendered) == 2
+
+        # neither a plain nor a compressed 304 renders the page
+        r = client.get('/', headers={ 'If-None-Match': etag })
+        assert r.status_code == 304
+        assert r.headers['ETag'] == etag
+
+        r = client.get('/', headers={ 'Accept-Encoding': 'gzip', 'If-None-Match': gz.headers['ETag'] })
+        assert r.status_code == 304
+        assert r.headers['ETag'] == gz.headers['ETag']
+        assert len(self.rendered) == 2
+
+        # a new stylesheet fingerprint is a new page
+        indieweb.assetFiles['main.css'] = 'main.abcdefabcd.css'
+        r = client.get('/', headers={ 'If-None-Match': etag })
+
+        assert r.status_code == 200
+        assert r.headers['ETag'] != etag
+        assert '/static/build/main.abcdefabcd.css' in r.data
+
+        # the feeds don't change with it
+        r = client.get('/feed.atom')
+        assert client.get('/feed.atom', headers={ 'If-None-Match': r.headers['ETag'] }).status_code == 304
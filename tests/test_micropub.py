@@ -45,6 +45,17 @@ class TestEndpoint(unittest.TestCase):
 
         # assert r.status_code == 200
 
+class TestQuery(unittest.TestCase):
+    def runTest(self):
+        url = 'http://127.0.0.1:9999/micropub'
+
+        # query with no access_token present
+        r = requests.get(url, params={ 'q': 'config' })
+        assert r.status_code == 400
+
+        r = requests.get(url, params={ 'q': 'syndicate-to' })
+        assert r.status_code == 400
+
 
 # POST /micropub HTTP/1.1
 # Host: bear.im
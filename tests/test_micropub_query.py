@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+:copyright: (c) 2015 by Mike Taylor
+:license: MIT, see LICENSE for more details.
+"""
+
+import json
+import unittest
+
+from appsetup import setupApp, accessToken
+
+syndicateTo = [ { 'uid': 'https://twitter.com/giudici', 'name': 'twitter' } ]
+
+class TestQueryConfig(unittest.TestCase):
+    def runTest(self):
+        client  = setupApp(syndicate_to=syndicateTo)
+        headers = { 'Authorization': 'Bearer %s' % accessToken() }
+
+        for query in ('config', 'syndicate-to'):
+            r = client.get('/micropub?q=%s' % query, headers=headers)
+
+            assert r.status_code == 200
+            assert r.mimetype == 'application/json'
+            assert json.loads(r.data) == { 'syndicate-to': syndicateTo }
+            assert 'ETag' in r.headers
+
+            r = client.get('/micropub?q=%s' % query, headers=dict(headers, **{ 'If-None-Match': r.headers['ETag'] }))
+
+            assert r.status_code == 304
+            assert r.data == ''
+
+class TestQuerySource(unittest.TestCase):
+    def runTest(self):
+        client  = setupApp()
+        headers = { 'Authorization': 'Bearer %s' % accessToken() }
+
+        r = client.get('/micropub?q=source&url=http://localhost:9999/article2', headers=headers)
+
+        assert r.status_code == 200
+        data = json.loads(r.data)
+        assert data['type'] == [ 'h-entry' ]
+        assert data['properties']['name']      == [ 'Article 2' ]
+        assert data['properties']['content']   == [ 'test article 2' ]
+        assert data['properties']['published'] == [ '2015-01-02T10:00:00Z' ]
+
+        r = client.get('/micropub?q=source&url=http://localhost:9999/article2', headers=dict(headers, **{ 'If-None-Match': r.headers['ETag'] }))
+
+        assert r.status_code == 304
+
+        # trailing slashes and a different scheme find the same entry
+        r = client.get('/micropub?q=source&url=https://localhost:9999/article2/', headers=headers)
+
+        assert r.status_code == 200
+
+        r = client.get('/micropub?q=source&url=http://localhost:9999/article2&properties[]=name&properties[]=url', headers=headers)
+
+        assert r.status_code == 200
+        assert json.loads(r.data) == { 'properties': { 'name': [ 'Article 2' ],
+                                                       'url':  [ 'http://localhost:9999/article2' ] } }
+
+class TestQueryErrors(unittest.TestCase):
+    def runTest(self):
+        client  = setupApp()
+        headers = { 'Authorization': 'Bearer %s' % accessToken() }
+
+        r = client.get('/micropub?q=source&url=http://localhost:9999/article9', headers=headers)
+        assert r.status_code == 404
+
+        r = client.get('/micropub?q=source', headers=headers)
+        assert r.status_code == 400
+
+        r = client.get('/micropub?q=unknown', headers=headers)
+        assert r.status_code == 400
+
+        r = client.get('/micropub?q=config')
+        assert r.status_code == 400
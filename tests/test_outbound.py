@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+"""
+:copyright: (c) 2015 by Mike Taylor
+:license: MIT, see LICENSE for more details.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from appsetup import setupApp, fakeResponse
+
+import indieweb
+
+sourceURL  = 'http://source.example/post'
+targetURL  = 'http://localhost:9999/article1'
+sourceHTML = '<div class="h-entry"><a href="%s">article 1</a></div>' % targetURL
+
+class TrickleBody(object):
+    """A response body that sends a few bytes at a time, slowly,
+    count times (forever if count is None)
+    """
+    def __init__(self, count=None, delay=0.05):
+        self.count = count
+        self.delay = delay
+
+    def read(self, size=None, **kwargs):
+        if self.count is not None:
+            if self.count == 0:
+                return ''
+            self.count -= 1
+        time.sleep(self.delay)
+        return 'x' * 10
+
+    def close(self):
+        pass
+
+class OutboundTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls   = []
+        self.results = []
+        self.get     = requests.get
+        self.post    = requests.post
+        requests.get  = self.fakeRequest
+        requests.post = self.fakeRequest
+
+    def tearDown(self):
+        requests.get  = self.get
+        requests.post = self.post
+
+    def fakeRequest(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        result = self.results[0]
+        if len(self.results) > 1:
+            self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result(url)
+
+    def mention(self, client):
+        return client.post('/webmention', data={ 'source': sourceURL, 'target': targetURL })
+
+class TestRetryAfter(OutboundTestCase):
+    def runTest(self):
+        client       = setupApp(breaker_cooldown=30)
+        self.results = [ requests.exceptions.ConnectTimeout('timed out') ]
+
+        r = self.mention(client)
+
+        assert r.status_code == 503
+        assert r.headers['Retry-After'] == '30'
+        assert self.calls[0][1]['timeout'] <= indieweb.cfg.request_budget
+
+class TestBreaker(OutboundTestCase):
+    def runTest(self):
+        client       = setupApp(breaker_threshold=2, breaker_cooldown=1)
+        self.results = [ requests.exceptions.ConnectionError('refused') ]
+
+        assert self.mention(client).status_code == 503
+        assert self.mention(client).status_code == 503
+        assert len(self.calls) == 2
+
+        # open, fails fast without a request
+        assert self.mention(client).status_code == 503
+        assert len(self.calls) == 2
+
+        time.sleep(1.1)
+
+        # half-open, only a single probe is let through
+        with indieweb.app.test_request_context():
+            state = indieweb.breakerState('source.example')
+            assert indieweb.breakerAllow('source.example', state)
+            assert not indieweb.breakerAllow('source.example', state)
+        indieweb.db.delete('breaker-probe-source.example')
+
+        self.results = [ lambda url: fakeResponse(url, sourceHTML) ]
+
+        assert self.mention(client).status_code == 302
+        assert len(self.calls) == 3
+        assert indieweb.db.hgetall('breaker-source.example') == {}
+
+        r = client.get('/metrics')
+
+        assert r.status_code == 200
+        assert 'indieweb_breaker_trips 1\n'      in r.data
+        assert 'indieweb_breaker_rejected 1\n'   in r.data
+        assert 'indieweb_outbound_failures 2\n'  in r.data
+
+class TestBudget(OutboundTestCase):
+    def runTest(self):
+        client       = setupApp(request_budget=0.2, outbound_timeout=0.2)
+        self.results = [ lambda url: fakeResponse(url, raw=TrickleBody()) ]
+
+        started = time.time()
+        r       = self.mention(client)
+
+        assert r.status_code == 503
+        assert time.time() - started < 0.5
+        data = client.get('/metrics').data
+        assert 'indieweb_budget_exhausted 1\n' in data
+        assert 'indieweb_outbound_failures'   not in data
+        assert indieweb.db.keys('breaker-*') == []
+
+class TestBudgetBlame(OutboundTestCase):
+    def runTest(self):
+        setupApp(request_budget=0.3, outbound_timeout=0.3, breaker_threshold=1)
+
+        def slowResponse(url):
+            time.sleep(0.28)
+            return fakeResponse(url, 'slow')
+
+        self.results = [ slowResponse, lambda url: fakeResponse(url, raw=TrickleBody(count=3, delay=0.02)) ]
+
+        with indieweb.app.test_request_context():
+            indieweb.startDeadline()
+            assert indieweb.fetchURL('http://slow.example/').content == 'slow'
+            self.assertRaises(indieweb.BudgetExhausted, indieweb.fetchURL, 'http://healthy.example/')
+
+        # the healthy host was only left a few ms, it is not to blame
+        assert indieweb.db.keys('breaker-*') == []
+        assert indieweb.db.hgetall('metrics') == { 'budget_exhausted': '1' }
+
+class TestSlowHost(OutboundTestCase):
+    def runTest(self):
+        setupApp(request_budget=1, outbound_timeout=0.1)
+        self.results = [ lambda url: fakeResponse(url, raw=TrickleBody()) ]
+
+        with indieweb.app.test_request_context():
+            indieweb.startDeadline()
+            self.assertRaises(indieweb.OutboundError, indieweb.fetchURL, 'http://slow.example/')
+            assert 0.1 - self.calls[0][1]['timeout'] < 0.01
+
+        # given its full timeout, the host is charged for using it up
+        assert indieweb.db.hget('breaker-slow.example', 'failures') == '1'
+        assert indieweb.db.hgetall('metrics') == { 'outbound_failures': '1' }
+
+class TestRedirects(OutboundTestCase):
+    def runTest(self):
+        client       = setupApp(max_redirects=3)
+        self.results = [ lambda url: fakeResponse(url, status=302, headers={ 'location': '/again' }) ]
+
+        r = self.mention(client)
+
+        assert r.status_code == 400
+        assert len(self.calls) == 4
+        assert self.calls[0][1]['allow_redirects'] is False
+
+class TestVouchScheme(OutboundTestCase):
+    def setUp(self):
+        super(TestVouchScheme, self).setUp()
+        self.basepath = tempfile.mkdtemp()
+        open(os.path.join(self.basepath, 'vouch_domains.txt'), 'w').close()
+
+    def tearDown(self):
+        super(TestVouchScheme, self).tearDown()
+        shutil.rmtree(self.basepath)
+
+    def runTest(self):
+        setupApp(basepath=self.basepath)
+        self.results = [ lambda url: fakeResponse(url, '<html></html>') ]
+
+        with indieweb.app.test_request_context():
+            assert indieweb.processVouch(sourceURL, targetURL, 'example.com') is False
+            assert self.calls[0][0] == 'http://example.com'
+
+            assert indieweb.processVouch(sourceURL, targetURL, 'ftp://example.com') is False
+            assert len(self.calls) == 1
+
+        assert indieweb.db.keys('breaker-*') == []
+        assert indieweb.db.hgetall('metrics') == {}
+
+class TestAuthCode(OutboundTestCase):
+    def runTest(self):
+        client       = setupApp()
+        authHTML     = '<link rel="authorization_endpoint" href="https://auth.example/auth?x=1">'
+        self.results = [ lambda url: fakeResponse(url, authHTML),
+                         requests.exceptions.ReadTimeout('timed out') ]
+
+        r = client.post('/token', data={ 'code': 'abc', 'me': 'http://me.example', 'client_id': 'https://quill.p3k.io',
+                                         'redirect_uri': 'https://quill.p3k.io/auth/callback', 'state': '1' })
+
+        assert r.status_code == 503
+        assert self.calls[1][0] == 'https://auth.example/auth'
+        assert self.calls[1][1]['data']['code'] == 'abc'
+        assert 'timeout' in self.calls[1][1]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""
+:copyright: (c) 2015 by Mike Taylor
+:license: MIT, see LICENSE for more details.
+"""
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+
+from appsetup import setupApp, accessToken, loginSession
+
+import indieweb
+
+class CaptureHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class ProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.basepath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.basepath)
+
+    def setupApp(self, **config):
+        self.profilePath = os.path.join(self.basepath, 'profiles')
+        return setupApp(profile_path=self.profilePath, **config)
+
+    def profiles(self):
+        if not os.path.exists(self.profilePath):
+            return []
+        return sorted([ name for name in os.listdir(self.profilePath) if name.endswith('.pstats') ])
+
+class TestProfileHeader(ProfileTestCase):
+    def runTest(self):
+        client = self.setupApp(profile_secret='sekrit')
+
+        assert client.get('/').status_code == 200
+        assert client.get('/', headers={ 'X-Indieweb-Profile': 'wrong' }).status_code == 200
+        assert client.get('/', headers={ 'X-Indieweb-Profile': 'sekri' }).status_code == 200
+        assert self.profiles() == []
+
+        assert client.get('/', headers={ 'X-Indieweb-Profile': 'sekrit' }).status_code == 200
+        profiles = self.profiles()
+        assert len(profiles) == 1
+        assert os.path.getsize(os.path.join(self.profilePath, profiles[0])) > 0
+
+class TestProfileSample(ProfileTestCase):
+    def runTest(self):
+        client = self.setupApp(profile_sample_rate=0)
+        client.get('/')
+        assert self.profiles() == []
+
+        indieweb.cfg.profile_sample_rate = 1
+        client.get('/')
+        client.get('/article1')
+        assert len(self.profiles()) == 2
+
+class TestProfileKeep(ProfileTestCase):
+    def runTest(self):
+        client = self.setupApp(profile_sample_rate=1, profile_keep=2)
+        for i in range(4):
+            client.get('/')
+        client.get('/article1')
+
+        profiles = self.profiles()
+        assert len(profiles) == 3
+        assert len([ name for name in profiles if name.startswith('handleArticles-') ]) == 1
+
+class TestProfileKeepConfig(ProfileTestCase):
+    def runTest(self):
+        configFile = os.path.join(self.basepath, 'indieweb.cfg')
+        with open(configFile, 'w') as h:
+            json.dump({ 'baseurl': 'http://localhost:9999', 'profile_keep': 0 }, h)
+
+        self.assertRaises(ValueError, indieweb.loadConfig, configFile)
+
+class TestRelativeProfilePath(ProfileTestCase):
+    def setUp(self):
+        super(TestRelativeProfilePath, self).setUp()
+        self.cwd = os.getcwd()
+        os.chdir(self.basepath)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        super(TestRelativeProfilePath, self).tearDown()
+
+    def runTest(self):
+        configFile = os.path.join(self.basepath, 'indieweb.cfg')
+        with open(configFile, 'w') as h:
+            json.dump({ 'baseurl': 'http://localhost:9999', 'logpath': '.' }, h)
+        profilePath = indieweb.loadConfig(configFile).profile_path
+
+        assert profilePath == os.path.join(os.getcwd(), 'profiles')
+
+        client           = setupApp(profile_sample_rate=1, profile_path=profilePath)
+        self.profilePath = profilePath
+        client.get('/')
+        name = self.profiles()[0]
+
+        loginSession(client)
+        r = client.get('/admin/profiles/%s' % name)
+
+        assert r.status_code == 200
+        with open(os.path.join(profilePath, name), 'rb') as h:
+            assert r.data == h.read()
+
+class TestAdminProfiles(ProfileTestCase):
+    def runTest(self):
+        client = self.setupApp(profile_secret='sekrit')
+        client.get('/', headers={ 'X-Indieweb-Profile': 'sekrit' })
+        name = self.profiles()[0]
+
+        assert client.get('/admin/profiles').status_code == 401
+        assert client.get('/admin/profiles/%s' % name).status_code == 401
+
+        # a session naming the owner but holding no valid token is refused
+        loginSession(client, token='not-a-valid-token')
+        assert client.get('/admin/profiles').status_code == 401
+        assert client.get('/admin/profiles/%s' % name).status_code == 401
+
+        # as is a token issued to someone else
+        headers = { 'Authorization': 'Bearer %s' % accessToken(me='http://me.example') }
+        assert client.get('/admin/profiles', headers=headers).status_code == 401
+
+        headers = { 'Authorization': 'Bearer %s' % accessToken() }
+        r       = client.get('/admin/profiles', headers=headers)
+
+        assert r.status_code == 200
+        profiles = json.loads(r.data)['profiles']
+        assert [ p['name'] for p in profiles ] == [ name ]
+        assert profiles[0]['url'] == '/admin/profiles/%s' % name
+
+        loginSession(client)
+        r = client.get(profiles[0]['url'])
+
+        assert r.status_code == 200
+        assert r.mimetype == 'application/octet-stream'
+        with open(os.path.join(self.profilePath, name), 'rb') as h:
+            assert r.data == h.read()
+
+class TestSlowRequest(ProfileTestCase):
+    def setUp(self):
+        super(TestSlowRequest, self).setUp()
+        self.handler = CaptureHandler()
+        indieweb.app.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        super(TestSlowRequest, self).tearDown()
+        indieweb.app.logger.removeHandler(self.handler)
+
+    def runTest(self):
+        client = self.setupApp(slow_request_ms=60000)
+        client.get('/article1')
+        assert [ m for m in self.handler.messages if m.startswith('slow request') ] == []
+
+        indieweb.cfg.slow_request_ms = 0
+        client.get('/article1')
+        slow = [ m for m in self.handler.messages if m.startswith('slow request') ]
+
+        assert len(slow) == 1
+        assert slow[0].startswith('slow request GET /article1 [handleArticles]')
+        phases = json.loads(slow[0][slow[0].index('{'):])
+        assert 'template' in phases
+        assert 'other'    in phases
@@ -7,6 +7,11 @@
 
 import unittest
 import ronkyuu
+import requests
+
+from appsetup import setupApp, fakeResponse
+
+import indieweb
 
 class TestEndpoint(unittest.TestCase):
     def runTest(self):
@@ -24,6 +29,82 @@ class TestWebmention(unittest.TestCase):
 
         assert result.status_code == 200
 
+class TestInvalidTarget(unittest.TestCase):
+    def runTest(self):
+        status_code, webmention_url = ronkyuu.discoverEndpoint('http://localhost:9999')
+
+        assert status_code == 200
+
+        result = ronkyuu.sendWebmention('http://boathole.org/testing', 'http://localhost:9999/article-missing', webmention_url)
+
+        assert result.status_code == 404
+
+class TestNormalizeURL(unittest.TestCase):
+    def runTest(self):
+        setupApp(domain_aliases=[ 'bear.im' ])
+
+        canonical = indieweb.normalizeURL('http://localhost:9999/article1')
+
+        assert canonical == 'localhost:9999/article1'
+        for url in ('https://localhost:9999/article1',
+                    'http://LOCALHOST:9999/article1/',
+                    'http://www.localhost:9999/article1',
+                    'localhost:9999/article1',
+                    'http://giudici.us/article1',
+                    'https://www.giudici.us:443/article1',
+                    'http://giudici.us:80/article1',
+                    'https://bear.im/article1/',
+                    'http://www.bear.im/article1'):
+            assert indieweb.normalizeURL(url) == canonical, url
+
+        assert indieweb.normalizeURL('http://giudici.us:8080/article1') != canonical
+        assert indieweb.normalizeURL('http://example.com/article1')     != canonical
+        assert indieweb.normalizeURL('http://localhost:9999/article10') != canonical
+
+class TestValidURL(unittest.TestCase):
+    def runTest(self):
+        setupApp(domain_aliases=[ 'bear.im' ])
+
+        assert indieweb.validURL('https://bear.im/article2')           == 200
+        assert indieweb.validURL('https://www.giudici.us:443/article3') == 200
+        assert indieweb.validURL('http://localhost:9999/article4')     == 404
+        assert indieweb.validURL('http://example.com/article1')        == 404
+        assert indieweb.validURL('http://localhost:9999/')             == 404
+        assert indieweb.validURL(None)                                 == 404
+
+class TestRejectedTarget(unittest.TestCase):
+    def setUp(self):
+        self.calls    = []
+        self.get      = requests.get
+        self.post     = requests.post
+        requests.get  = self.fakeRequest
+        requests.post = self.fakeRequest
+
+    def tearDown(self):
+        requests.get  = self.get
+        requests.post = self.post
+
+    def fakeRequest(self, url, **kwargs):
+        self.calls.append(url)
+        return fakeResponse(url, '<a href="https://giudici.us:443/article1">article 1</a>')
+
+    def runTest(self):
+        client = setupApp(domain_aliases=[ 'bear.im' ])
+
+        for target in ('http://localhost:9999/article-missing',
+                       'https://bear.im/article9',
+                       'http://example.com/article1'):
+            r = client.post('/webmention', data={ 'source': 'http://source.example/post', 'target': target })
+
+            assert r.status_code == 404
+        assert self.calls == []
+
+        # a target on an alias host is accepted and the source fetched
+        r = client.post('/webmention', data={ 'source': 'http://source.example/post', 'target': 'https://giudici.us:443/article1' })
+
+        assert r.status_code == 302
+        assert self.calls[0] == 'http://source.example/post'
+
 # if __name__ == '__main__':
 #     parser = argparse.ArgumentParser()
 #     parser.add_argument('sourceURL')